@@ -3,6 +3,7 @@ from fastapi.responses import FileResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
 import os
 import logging
 from pathlib import Path
@@ -13,6 +14,9 @@ from datetime import datetime, timezone
 import shutil
 from PIL import Image
 import io
+import re
+import asyncio
+import numpy as np
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -89,6 +93,202 @@ class CommentCreate(BaseModel):
     author: str
     content: str
 
+# Index des articles similaires
+RELATED_TOP_K = 10
+RELATED_MAX_TERMS = 64  # strongest TF-IDF terms kept per article
+RELATED_CATEGORY_BOOST = 0.25  # score bonus for articles of the same category
+RELATED_BATCH_CELLS = 4_000_000  # max size of a (batch x articles) score block
+RELATED_REBUILD_INTERVAL = int(os.environ.get('RELATED_REBUILD_INTERVAL', 6 * 3600))
+
+TAG_RE = re.compile(r'<[^>]+>')
+TOKEN_RE = re.compile(r'[^\W\d_]{3,}')
+
+def _ranges(starts, lengths):
+    """Concatenation of arange(start, start + length) for each pair."""
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(lengths.sum())
+
+class RelatedIndex:
+    """TF-IDF vectors over article title and content, with precomputed top-k neighbors.
+
+    Vectors are kept sparse (top RELATED_MAX_TERMS terms, L2-normalised) and
+    similarities are computed in batches through an inverted index, so a full
+    build stays tractable for tens of thousands of articles. Between full
+    builds, create/update/delete are applied incrementally with the current
+    document frequencies.
+    """
+
+    def __init__(self):
+        self.vocab = {}
+        self.df = np.zeros(0, dtype=np.int64)
+        self.ids = []
+        self.pos = {}
+        self.categories = []
+        self.terms = []  # all distinct term columns of each article, for df bookkeeping
+        self.vectors = []  # (columns, weights) of each article
+        self.neighbors = {}  # article id -> [(score, neighbor id)], best first
+        self._matrix = None
+
+    @staticmethod
+    def _tokenize(article):
+        title = article.get('title') or ''
+        # Title words are counted twice so they weigh more than body text
+        text = TAG_RE.sub(' ', f"{title} {title} {article.get('content') or ''}")
+        return TOKEN_RE.findall(text.lower())
+
+    def _term_counts(self, article):
+        tokens = self._tokenize(article)
+        cols = np.fromiter(
+            (self.vocab.setdefault(t, len(self.vocab)) for t in tokens),
+            dtype=np.int64, count=len(tokens)
+        )
+        if len(self.vocab) > len(self.df):
+            self.df = np.concatenate([self.df, np.zeros(len(self.vocab) - len(self.df) + 1024, dtype=np.int64)])
+        return np.unique(cols, return_counts=True)
+
+    def _weigh(self, cols, counts):
+        idf = np.log((1 + len(self.ids)) / (1 + self.df[cols])) + 1
+        weights = (1 + np.log(counts)) * idf
+        if len(weights) > RELATED_MAX_TERMS:
+            keep = np.argpartition(weights, -RELATED_MAX_TERMS)[-RELATED_MAX_TERMS:]
+            cols, weights = cols[keep], weights[keep]
+        norm = np.linalg.norm(weights)
+        if norm:
+            weights = weights / norm
+        return cols, weights.astype(np.float32)
+
+    def _build_matrix(self):
+        """CSR rows plus a CSC copy (the inverted index) of all article vectors."""
+        if self._matrix is None:
+            lengths = np.array([len(c) for c, _ in self.vectors], dtype=np.int64)
+            indices = np.concatenate([c for c, _ in self.vectors])
+            data = np.concatenate([w for _, w in self.vectors])
+            order = np.argsort(indices, kind='stable')
+            col_ptr = np.concatenate(([0], np.cumsum(np.bincount(indices, minlength=len(self.vocab)))))
+            rows = np.repeat(np.arange(len(self.ids)), lengths)
+            categories = np.unique(self.categories, return_inverse=True)[1]
+            self._matrix = (
+                np.concatenate(([0], np.cumsum(lengths))), indices, data,
+                col_ptr, rows[order], data[order], categories
+            )
+        return self._matrix
+
+    def _scores(self, rows):
+        """Cosine similarities (with category bonus) of `rows` against every article."""
+        indptr, indices, data, col_ptr, col_rows, col_data, categories = self._build_matrix()
+        n = len(self.ids)
+        lengths = indptr[rows + 1] - indptr[rows]
+        query_row = np.repeat(np.arange(len(rows)), lengths)
+        nz = _ranges(indptr[rows], lengths)
+        cols, values = indices[nz], data[nz]
+        post_lengths = col_ptr[cols + 1] - col_ptr[cols]
+        postings = _ranges(col_ptr[cols], post_lengths)
+        scores = np.bincount(
+            np.repeat(query_row, post_lengths) * n + col_rows[postings],
+            weights=np.repeat(values, post_lengths) * col_data[postings],
+            minlength=len(rows) * n
+        ).astype(np.float64, copy=False).reshape(len(rows), n)
+        scores[categories[rows][:, None] == categories[None, :]] *= 1 + RELATED_CATEGORY_BOOST
+        scores[np.arange(len(rows)), rows] = 0
+        return scores
+
+    def _set_neighbors(self, rows, scores):
+        k = min(RELATED_TOP_K, len(self.ids) - 1)
+        if k <= 0:
+            top = np.zeros((len(rows), 0), dtype=np.int64)
+        else:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        for row, cols, row_scores in zip(rows, top, scores):
+            self.neighbors[self.ids[row]] = sorted(
+                ((float(row_scores[c]), self.ids[c]) for c in cols if row_scores[c] > 0),
+                reverse=True
+            )
+
+    def _refresh(self, article_ids):
+        """Recompute the neighbor lists of the given articles from scratch."""
+        rows = np.array([self.pos[i] for i in article_ids], dtype=np.int64)
+        batch = max(1, RELATED_BATCH_CELLS // max(1, len(self.ids)))
+        for start in range(0, len(rows), batch):
+            chunk = rows[start:start + batch]
+            self._set_neighbors(chunk, self._scores(chunk))
+
+    def rebuild(self, articles):
+        """Index `articles` from scratch and return every article id."""
+        self.__init__()
+        counted = []
+        for article in articles:
+            cols, counts = self._term_counts(article)
+            self.df[cols] += 1
+            self.pos[article['id']] = len(self.ids)
+            self.ids.append(article['id'])
+            self.categories.append(article.get('category_id') or '')
+            self.terms.append(cols)
+            counted.append((cols, counts))
+        self.vectors = [self._weigh(cols, counts) for cols, counts in counted]
+        self._refresh(self.ids)
+        return list(self.ids)
+
+    def upsert(self, article):
+        """Add or replace one article and return the ids whose neighbors changed."""
+        article_id = article['id']
+        cols, counts = self._term_counts(article)
+        if article_id in self.pos:
+            row = self.pos[article_id]
+            self.df[self.terms[row]] -= 1
+        else:
+            row = len(self.ids)
+            self.pos[article_id] = row
+            self.ids.append(article_id)
+            self.categories.append(None)
+            self.terms.append(None)
+            self.vectors.append(None)
+        self.df[cols] += 1
+        self.categories[row] = article.get('category_id') or ''
+        self.terms[row] = cols
+        self.vectors[row] = self._weigh(cols, counts)
+        self._matrix = None
+
+        scores = self._scores(np.array([row]))
+        self._set_neighbors([row], scores)
+        scores = scores[0]
+        changed = {article_id}
+        stale = []
+        for other, neighbors in self.neighbors.items():
+            if other == article_id:
+                continue
+            score = float(scores[self.pos[other]])
+            previous = next((s for s, i in neighbors if i == article_id), None)
+            if previous is not None and score < previous:
+                # A dropped neighbor may let an unlisted article back in
+                stale.append(other)
+            elif previous is not None or (score > 0 and (len(neighbors) < RELATED_TOP_K or score > neighbors[-1][0])):
+                kept = [(s, i) for s, i in neighbors if i != article_id]
+                self.neighbors[other] = sorted(kept + [(score, article_id)], reverse=True)[:RELATED_TOP_K]
+                changed.add(other)
+        self._refresh(stale)
+        return changed | set(stale)
+
+    def remove(self, article_id):
+        """Drop one article and return the ids whose neighbors changed."""
+        if article_id not in self.pos:
+            return set()
+        row = self.pos.pop(article_id)
+        self.df[self.terms[row]] -= 1
+        last = len(self.ids) - 1
+        for values in (self.ids, self.categories, self.terms, self.vectors):
+            values[row] = values[last]
+            values.pop()
+        if row != last:
+            self.pos[self.ids[row]] = row
+        self.neighbors.pop(article_id, None)
+        self._matrix = None
+        stale = [i for i, neighbors in self.neighbors.items() if any(n == article_id for _, n in neighbors)]
+        self._refresh(stale)
+        return set(stale)
+
+related_index = RelatedIndex()
+related_queue = asyncio.Queue()
+
 # Routes pour les catégories
 @api_router.post("/categories", response_model=Category)
 async def create_category(input: CategoryCreate):
@@ -129,6 +329,7 @@ async def create_article(input: ArticleCreate):
     doc['created_at'] = doc['created_at'].isoformat()
     doc['updated_at'] = doc['updated_at'].isoformat()
     await db.articles.insert_one(doc)
+    related_queue.put_nowait(article_obj.id)
     return article_obj
 
 @api_router.get("/articles", response_model=List[Article])
@@ -167,6 +368,32 @@ async def get_article(article_id: str):
         article['updated_at'] = datetime.fromisoformat(article['updated_at'])
     return article
 
+@api_router.get("/articles/{article_id}/related", response_model=List[Article])
+async def get_related_articles(
+    article_id: str,
+    limit: int = Query(5, ge=1, le=RELATED_TOP_K),
+    published_only: bool = Query(False)
+):
+    entry = await db.related_articles.find_one({"article_id": article_id}, {"_id": 0})
+    if not entry:
+        if not await db.articles.find_one({"id": article_id}, {"_id": 0, "id": 1}):
+            raise HTTPException(status_code=404, detail="Article non trouvé")
+        return []
+    
+    related_ids = [r['id'] for r in entry['related']]
+    query = {"id": {"$in": related_ids}}
+    if published_only:
+        query['published'] = True
+    found = await db.articles.find(query, {"_id": 0}).to_list(len(related_ids))
+    by_id = {article['id']: article for article in found}
+    articles = [by_id[i] for i in related_ids if i in by_id][:limit]
+    for article in articles:
+        if isinstance(article['created_at'], str):
+            article['created_at'] = datetime.fromisoformat(article['created_at'])
+        if isinstance(article['updated_at'], str):
+            article['updated_at'] = datetime.fromisoformat(article['updated_at'])
+    return articles
+
 @api_router.put("/articles/{article_id}", response_model=Article)
 async def update_article(article_id: str, input: ArticleUpdate):
     update_data = {k: v for k, v in input.model_dump().items() if v is not None}
@@ -188,6 +415,8 @@ async def update_article(article_id: str, input: ArticleUpdate):
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Article non trouvé")
+    if update_data.keys() & {'title', 'content', 'category_id'}:
+        related_queue.put_nowait(article_id)
     
     article = await db.articles.find_one({"id": article_id}, {"_id": 0})
     if isinstance(article['created_at'], str):
@@ -203,6 +432,7 @@ async def delete_article(article_id: str):
         raise HTTPException(status_code=404, detail="Article non trouvé")
     # Delete associated comments
     await db.comments.delete_many({"article_id": article_id})
+    related_queue.put_nowait(article_id)
     return {"message": "Article supprimé avec succès"}
 
 # Routes pour les commentaires
@@ -295,6 +525,70 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Tâche de fond pour les articles similaires
+RELATED_FIELDS = {"_id": 0, "id": 1, "title": 1, "content": 1, "category_id": 1}
+
+async def save_related(article_ids, now):
+    operations = [
+        UpdateOne(
+            {"article_id": article_id},
+            {"$set": {
+                "related": [{"id": i, "score": score} for score, i in related_index.neighbors[article_id]],
+                "updated_at": now
+            }},
+            upsert=True
+        )
+        for article_id in article_ids if article_id in related_index.neighbors
+    ]
+    if operations:
+        await db.related_articles.bulk_write(operations, ordered=False)
+
+async def rebuild_related_index():
+    started = datetime.now(timezone.utc).isoformat()
+    articles = await db.articles.find({}, RELATED_FIELDS).to_list(None)
+    article_ids = await asyncio.to_thread(related_index.rebuild, articles)
+    await save_related(article_ids, started)
+    # Entries not rewritten by this build belong to deleted articles
+    await db.related_articles.delete_many({"updated_at": {"$lt": started}})
+    logger.info(f"Related articles index built for {len(article_ids)} articles")
+
+async def update_related_index(article_ids):
+    changed = set()
+    for article_id in article_ids:
+        article = await db.articles.find_one({"id": article_id}, RELATED_FIELDS)
+        if article:
+            changed |= await asyncio.to_thread(related_index.upsert, article)
+        else:
+            changed |= await asyncio.to_thread(related_index.remove, article_id)
+            await db.related_articles.delete_one({"article_id": article_id})
+    await save_related(changed, datetime.now(timezone.utc).isoformat())
+
+async def related_index_worker():
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await rebuild_related_index()
+            deadline = loop.time() + RELATED_REBUILD_INTERVAL
+            while loop.time() < deadline:
+                try:
+                    article_ids = {await asyncio.wait_for(related_queue.get(), deadline - loop.time())}
+                except asyncio.TimeoutError:
+                    break
+                while not related_queue.empty():
+                    article_ids.add(related_queue.get_nowait())
+                await update_related_index(article_ids)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error updating related articles index: {e}")
+            await asyncio.sleep(60)
+
+@app.on_event("startup")
+async def start_related_index():
+    await db.related_articles.create_index("article_id", unique=True)
+    app.state.related_task = asyncio.create_task(related_index_worker())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    app.state.related_task.cancel()
     client.close()
\ No newline at end of file
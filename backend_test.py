@@ -158,7 +158,15 @@ class RDCBlogAPITester:
                 f"articles/{self.created_article_id}",
                 200
             )
-            
+
+            # Test related articles
+            success, response = self.run_test(
+                "Get Related Articles",
+                "GET",
+                f"articles/{self.created_article_id}/related",
+                200
+            )
+
             # Test update article
             update_data = {
                 "title": "Updated Test Article RDC",